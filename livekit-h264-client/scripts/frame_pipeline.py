@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+摄像头推流共用的帧缓冲区池和LiveKit后台推送线程
+"""
+import logging
+import queue
+import threading
+
+import numpy as np
+from livekit import rtc
+
+logger = logging.getLogger(__name__)
+
+# 帧调度允许落后的最大时间（秒），超过后重新对齐截止时间
+MAX_FRAME_LAG = 0.5
+# I420帧缓冲区数量：采集写入、发送队列、LiveKit推送中各占一个
+FRAME_BUFFERS = 3
+# 等待空闲缓冲区的最长时间（秒），超时说明缓冲区未被归还
+FRAME_ACQUIRE_TIMEOUT = 1.0
+
+
+class FramePool:
+    """预分配的一维帧缓冲区池
+
+    memoryview(buf)可直接交给rtc.VideoFrame而无需tobytes()。
+    livekit 1.0.17的VideoFrame会在构造时复制一次数据；livekit>=1.1（pyproject允许）直接引用缓冲区，
+    此时推送在后台线程进行，缓冲区必须在推送完成或被丢弃后才归还，采集才不会覆盖推送中的数据。
+    """
+    def __init__(self, frame_size: int, count: int = FRAME_BUFFERS):
+        self._free = queue.SimpleQueue()
+        for _ in range(count):
+            self._free.put(np.empty(frame_size, np.uint8))
+
+    def acquire(self, timeout: float = FRAME_ACQUIRE_TIMEOUT):
+        """取出一个空闲缓冲区，超时返回None"""
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            logger.error(f"{timeout}秒内没有空闲帧缓冲区，缓冲区可能未被归还")
+            return None
+
+    def release(self, buf):
+        """归还acquire取出的缓冲区"""
+        self._free.put(buf)
+
+
+class FrameSender:
+    """在后台线程调用capture_frame，单槽队列，满时丢弃旧帧
+
+    capture_frame在原生侧可能阻塞数毫秒，放到独立线程后采集、转换与推送并行进行。
+    每帧推送完成或被丢弃后调用release归还缓冲区。
+    """
+    def __init__(self, source: rtc.VideoSource, release):
+        self.source = source
+        self.release = release
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = None
+
+    def start(self):
+        """启动推送线程"""
+        self._thread = threading.Thread(target=self._run, name="livekit-sender", daemon=True)
+        self._thread.start()
+
+    def send(self, frame, buf):
+        """提交一帧（非阻塞），队列中未推送的旧帧会被丢弃"""
+        try:
+            self._queue.put_nowait((frame, buf))
+        except queue.Full:
+            self._drop_pending()
+            self._queue.put_nowait((frame, buf))
+
+    def stop(self):
+        """停止推送线程"""
+        if self._thread:
+            self._drop_pending()
+            self._queue.put(None)
+            self._thread.join(timeout=1)
+
+    def _drop_pending(self):
+        try:
+            _, old_buf = self._queue.get_nowait()
+            self.release(old_buf)
+        except queue.Empty:
+            pass
+
+    def _run(self):
+        capture_frame = self.source.capture_frame
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            frame, buf = item
+            try:
+                capture_frame(frame)
+            except Exception as e:
+                logger.error(f"推送帧失败: {e}")
+            finally:
+                self.release(buf)
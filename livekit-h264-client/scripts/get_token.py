@@ -7,6 +7,21 @@ import json
 import os
 import sys
 from typing import Optional
+from requests.adapters import HTTPAdapter, Retry
+
+# 连接超时短、读取超时稍长：token服务不可达时快速失败
+REQUEST_TIMEOUT = (1.0, 5.0)
+
+# 模块级复用的Session，保持连接池和keep-alive，避免每次请求重建TCP连接
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=1,
+    # 只重试连接失败；读取超时不重试，避免服务挂起时等待数倍的读取超时
+    max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2),
+)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
 
 
 def get_livekit_token(
@@ -29,7 +44,7 @@ def get_livekit_token(
         url = f"{token_endpoint}?room={room}&username={username}"
         print(f"🔑 正在获取token: {url}")
         
-        response = requests.get(url, timeout=10)
+        response = _session.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         
         data = response.json()
@@ -4,20 +4,20 @@
 """
 import asyncio
 import logging
-import time
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import cv2
 import numpy as np
 from signal import SIGINT, SIGTERM
-from time import perf_counter
 
 # 添加src目录到Python路径
 sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from livekit import rtc
 from scripts.get_token import get_livekit_token
+from scripts.frame_pipeline import MAX_FRAME_LAG, FramePool, FrameSender
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -26,10 +26,18 @@ logger = logging.getLogger(__name__)
 WIDTH, HEIGHT = 1280, 720
 FPS = 30
 
+# 单帧转换在采集线程内串行执行即可，避免parallel_for_线程调度开销和OpenCL初始化
+cv2.setNumThreads(1)
+cv2.ocl.setUseOpenCL(False)
+
 class CameraCapture:
     def __init__(self, device="/dev/video0"):
         self.device = device
         self.cap = None
+        # 预分配I420输出缓冲区池，避免每帧分配；推送完成后由FrameSender归还
+        self.frame_pool = FramePool(WIDTH * HEIGHT * 3 // 2)
+        # 摄像头无法输出目标分辨率时的缩放缓冲区
+        self._bgr = np.empty((HEIGHT, WIDTH, 3), np.uint8)
         
     def start(self):
         """启动摄像头"""
@@ -44,18 +52,28 @@ class CameraCapture:
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
         self.cap.set(cv2.CAP_PROP_FPS, FPS)
+        # 驱动缓冲区只保留1帧，避免排队帧带来的额外延迟（非V4L2后端会忽略）
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         
         logger.info(f"摄像头已启动: {self.device}")
         
     def read_frame(self):
-        """读取一帧"""
+        """读取一帧并转换为I420格式，返回池中的一维缓冲区（失败返回None）"""
         ret, frame = self.cap.read()
         if ret:
-            # 调整大小
-            frame = cv2.resize(frame, (WIDTH, HEIGHT))
-            # 转换BGR到RGBA
-            frame_rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-            return frame_rgba
+            # 仅在摄像头未按要求输出分辨率时缩放
+            if frame.shape[:2] != (HEIGHT, WIDTH):
+                frame = cv2.resize(frame, (WIDTH, HEIGHT), dst=self._bgr, interpolation=cv2.INTER_AREA)
+            # 转换BGR到I420（1.5字节/像素），写入空闲缓冲区
+            buf = self.frame_pool.acquire()
+            if buf is None:
+                return None
+            try:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=buf.reshape(HEIGHT * 3 // 2, WIDTH))
+            except Exception:
+                self.frame_pool.release(buf)
+                raise
+            return buf
         return None
         
     def stop(self):
@@ -67,33 +85,63 @@ class CameraCapture:
 async def camera_stream_loop(source: rtc.VideoSource, camera: CameraCapture):
     """摄像头流循环 - 基于官方示例的帧率控制"""
     framerate = 1 / FPS
-    next_frame_time = perf_counter()
     frame_count = 0
-    start_time = time.time()
     
-    while True:
-        try:
-            frame_data = camera.read_frame()
-            if frame_data is not None:
-                # 创建VideoFrame - 使用正确的格式
-                frame = rtc.VideoFrame(WIDTH, HEIGHT, rtc.VideoBufferType.RGBA, frame_data.tobytes())
-                source.capture_frame(frame)
-                
-                # 性能监控
-                frame_count += 1
-                if frame_count % 100 == 0:
-                    elapsed = time.time() - start_time
-                    fps = frame_count / elapsed
-                    logger.info(f"推流性能: {fps:.1f} fps, 帧数: {frame_count}")
-            else:
-                logger.warning("无法读取摄像头帧")
+    # 阻塞的V4L2读取放到专用单线程执行器，避免卡住事件循环
+    # 单线程保证摄像头始终在同一线程访问
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    # 帧率统计复用帧调度时钟，不再额外调用time.time()
+    fps_last_t = deadline
+    fps_last_n = 0
+    capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="camera")
+    # LiveKit推送放到后台线程，与下一帧采集并行
+    sender = FrameSender(source, camera.frame_pool.release)
+    sender.start()
+    # 循环外绑定热点方法，避免每帧属性查找
+    read_frame = camera.read_frame
+    send_frame = sender.send
+    release_frame = camera.frame_pool.release
+    
+    try:
+        while True:
+            try:
+                frame_data = await loop.run_in_executor(capture_executor, read_frame)
+                if frame_data is not None:
+                    # 创建VideoFrame - 传入缓冲区视图，省去tobytes()复制
+                    # 注意：livekit 1.0.17的VideoFrame内部仍会bytearray()复制一次，>=1.1才直接引用缓冲区
+                    # 缓冲区在推送完成后才归还，下一帧不会覆盖推送中的数据
+                    try:
+                        frame = rtc.VideoFrame(WIDTH, HEIGHT, rtc.VideoBufferType.I420, memoryview(frame_data))
+                        send_frame(frame, frame_data)
+                    except Exception:
+                        release_frame(frame_data)
+                        raise
+                    
+                    # 性能监控
+                    frame_count += 1
+                    if frame_count % 100 == 0 and logger.isEnabledFor(logging.INFO):
+                        now = loop.time()
+                        fps = (frame_count - fps_last_n) / (now - fps_last_t)
+                        fps_last_t, fps_last_n = now, frame_count
+                        logger.info(f"推流性能: {fps:.1f} fps, 帧数: {frame_count}")
+                else:
+                    logger.warning("无法读取摄像头帧")
+                    
+            except Exception as e:
+                logger.error(f"处理帧失败: {e}")
                 
-        except Exception as e:
-            logger.error(f"处理帧失败: {e}")
-            
-        # 精确的帧率控制 - 基于官方示例
-        next_frame_time += 1 / FPS
-        await asyncio.sleep(max(0, next_frame_time - perf_counter()))
+            # 精确的帧率控制 - 按绝对截止时间调度，避免误差累积
+            deadline += framerate
+            now = loop.time()
+            if now - deadline > MAX_FRAME_LAG:
+                # 长时间卡顿后重新对齐，避免连续突发补帧
+                deadline = now
+            # 落后时sleep(0)也会让出事件循环，保证LiveKit网络任务运行
+            await asyncio.sleep(max(0, deadline - now))
+    finally:
+        sender.stop()
+        capture_executor.shutdown(wait=False)
 
 async def main():
     """主函数 - 基于官方示例结构"""
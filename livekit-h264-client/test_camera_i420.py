@@ -5,9 +5,10 @@
 """
 import asyncio
 import logging
-import time
 import os
+import struct
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import cv2
 import numpy as np
@@ -18,6 +19,7 @@ sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from livekit import rtc
 from scripts.get_token import get_livekit_token
+from scripts.frame_pipeline import MAX_FRAME_LAG, FramePool, FrameSender
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -26,11 +28,22 @@ logger = logging.getLogger(__name__)
 WIDTH, HEIGHT = 1280, 720
 FPS = 30
 
+# 单帧转换在采集线程内串行执行即可，避免parallel_for_线程调度开销和OpenCL初始化
+cv2.setNumThreads(1)
+cv2.ocl.setUseOpenCL(False)
+
 class I420CameraCapture:
     def __init__(self, device="/dev/video0"):
         self.device = device
         self.cap = None
         self.actual_format = None
+        # 是否直接读取原始YUYV数据（关闭OpenCV内部的YUYV->BGR转换）
+        self.raw_yuyv = False
+        
+        # 预分配I420输出缓冲区池，避免每帧分配；推送完成后由FrameSender归还
+        self.frame_pool = FramePool(WIDTH * HEIGHT * 3 // 2)
+        # 摄像头回退到其他分辨率的BGR输出时的缩放缓冲区
+        self._bgr = np.empty((HEIGHT, WIDTH, 3), np.uint8)
         
     def start(self):
         """启动摄像头，优先使用YUYV格式"""
@@ -43,38 +56,62 @@ class I420CameraCapture:
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, WIDTH)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, HEIGHT)
         self.cap.set(cv2.CAP_PROP_FPS, FPS)
+        # 驱动缓冲区只保留1帧，避免排队帧带来的额外延迟
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         
         # 检查实际格式
         actual_fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
-        self.actual_format = "".join([chr((actual_fourcc >> 8 * i) & 0xFF) for i in range(4)])
-        logger.info(f"摄像头已启动: {self.device}, 格式: {self.actual_format}")
+        self.actual_format = struct.pack('<I', actual_fourcc).decode('ascii', 'ignore')
+        
+        actual_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        
+        # YUYV且分辨率符合时关闭自动RGB转换，read()直接返回原始YUYV，省去一次整帧BGR转换
+        # 分辨率不符（很多UVC摄像头的YUYV只支持小分辨率）时保留BGR输出，走缩放路径
+        if self.actual_format == 'YUYV' and actual_size == (WIDTH, HEIGHT):
+            self.raw_yuyv = bool(self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+        
+        path = "原始YUYV直接拆分" if self.raw_yuyv else "BGR转换"
+        logger.info(f"摄像头已启动: {self.device}, 格式: {self.actual_format}, "
+                    f"分辨率: {actual_size[0]}x{actual_size[1]}, 转换路径: {path}")
         
     def read_frame(self):
-        """读取一帧并转换为I420格式"""
+        """读取一帧并转换为I420格式，返回池中的一维缓冲区（失败返回None）"""
         ret, frame = self.cap.read()
         if not ret:
             return None
         
-        # 根据实际格式选择最优转换方式
-        if self.actual_format == 'YUYV':
-            # YUYV格式，尝试直接转换
-            try:
-                # 注意：OpenCV的read()可能已经自动转换为BGR
-                # 如果frame确实是YUYV格式，使用YUYV2YUV_I420
-                if len(frame.shape) == 2:  # YUYV通常是2D数组
-                    yuv = cv2.cvtColor(frame, cv2.COLOR_YUYV2YUV_I420)
-                else:
-                    # OpenCV已经转换为BGR，使用BGR转换
-                    yuv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
-            except cv2.error:
-                # 兜底：如果YUYV转换失败，当作BGR处理
-                logger.warning("YUYV转换失败，使用BGR转换")
-                yuv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
-        else:
-            # 其他格式（MJPG等），通常已经是BGR
-            yuv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+        buf = self.frame_pool.acquire()
+        if buf is None:
+            return None
+        try:
+            if frame.ndim == 3 and frame.shape[2] == 3:
+                # BGR帧（MJPG解码或CONVERT_RGB未生效），使用BGR转换
+                # 尺寸不符时cvtColor会另行分配输出而不写入dst，需先缩放到目标分辨率
+                if frame.shape[:2] != (HEIGHT, WIDTH):
+                    frame = cv2.resize(frame, (WIDTH, HEIGHT), dst=self._bgr, interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=buf.reshape(HEIGHT * 3 // 2, WIDTH))
+            elif frame.size >= WIDTH * HEIGHT * 2:
+                # 原始YUYV（Y0 U0 Y1 V0 ...），直接拆分平面，一步得到I420
+                # 部分驱动的bytesused带填充，只取有效部分
+                yuyv = frame.reshape(-1)[:WIDTH * HEIGHT * 2].reshape(HEIGHT, WIDTH, 2)
+                self._yuyv_to_i420(yuyv, buf)
+            else:
+                self.frame_pool.release(buf)
+                logger.warning(f"未知的帧格式: shape={frame.shape}")
+                return None
+        except Exception:
+            self.frame_pool.release(buf)
+            raise
         
-        return yuv
+        return buf
+    
+    @staticmethod
+    def _yuyv_to_i420(yuyv, buf):
+        """YUYV(4:2:2) -> I420(4:2:0)：Y直接复制，UV取偶数行"""
+        y_size = WIDTH * HEIGHT
+        np.copyto(buf[:y_size].reshape(HEIGHT, WIDTH), yuyv[:, :, 0])
+        np.copyto(buf[y_size:y_size * 5 // 4].reshape(HEIGHT // 2, WIDTH // 2), yuyv[::2, ::2, 1])
+        np.copyto(buf[y_size * 5 // 4:].reshape(HEIGHT // 2, WIDTH // 2), yuyv[::2, 1::2, 1])
     
         
     def stop(self):
@@ -169,35 +206,49 @@ async def main():
     
     logger.info("开始推流摄像头画面...")
     
-    # 正确的帧率控制
+    # 正确的帧率控制 - 按绝对截止时间调度，避免误差累积
     frame_duration = 1.0 / FPS
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    # 阻塞的V4L2读取放到专用单线程执行器，单线程保证摄像头始终在同一线程访问
+    capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="camera")
+    # LiveKit推送放到后台线程，与下一帧采集并行
+    sender = FrameSender(video_source, camera.frame_pool.release)
+    sender.start()
+    # 循环外绑定热点方法，避免每帧属性查找
+    read_frame = camera.read_frame
+    send_frame = sender.send
+    release_frame = camera.frame_pool.release
     
     try:
         while True:
-            loop_start_time = time.monotonic()
-            
             # 异步执行阻塞的read_frame
-            i420_data = await loop.run_in_executor(None, camera.read_frame)
+            i420_data = await loop.run_in_executor(capture_executor, read_frame)
             
             if i420_data is not None:
-                # 创建VideoFrame并推送到LiveKit
-                frame = rtc.VideoFrame(
-                    WIDTH, HEIGHT, 
-                    rtc.VideoBufferType.I420, 
-                    i420_data.tobytes()
-                )
-                video_source.capture_frame(frame)
+                # 创建VideoFrame并推送到LiveKit - 传入缓冲区视图，省去tobytes()复制
+                # 注意：livekit 1.0.17的VideoFrame内部仍会bytearray()复制一次，>=1.1才直接引用缓冲区
+                # 缓冲区在推送完成后才归还，下一帧不会覆盖推送中的数据
+                try:
+                    frame = rtc.VideoFrame(
+                        WIDTH, HEIGHT, 
+                        rtc.VideoBufferType.I420, 
+                        memoryview(i420_data)
+                    )
+                    send_frame(frame, i420_data)
+                except Exception:
+                    release_frame(i420_data)
+                    raise
             else:
                 logger.warning("无法读取摄像头帧")
             
-            # 计算处理时间并调整睡眠时间
-            process_time = time.monotonic() - loop_start_time
-            sleep_time = frame_duration - process_time
-            
-            if sleep_time > 0:
-                await asyncio.sleep(sleep_time)
-            # else: 帧处理超时，立即开始下一帧
+            deadline += frame_duration
+            now = loop.time()
+            if now - deadline > MAX_FRAME_LAG:
+                # 长时间卡顿后重新对齐，避免连续突发补帧
+                deadline = now
+            # 落后时sleep(0)也会让出事件循环，保证LiveKit网络任务运行
+            await asyncio.sleep(max(0, deadline - now))
                 
     except KeyboardInterrupt:
         logger.info("收到中断信号，正在停止...")
@@ -205,6 +256,9 @@ async def main():
         logger.error(f"推流过程中出错: {e}")
     finally:
         # 清理资源
+        sender.stop()
+        # 等待进行中的读取结束后再释放摄像头
+        capture_executor.shutdown(wait=True)
         camera.stop()
         await room.disconnect()
         logger.info("已断开连接")